@@ -1,13 +1,18 @@
-from zpl.elements import TextElement, BarcodeElement, LogoElement, LineElement, BoxElement, ImageElement
+from zpl.elements import TextElement, BarcodeElement, LogoElement, LineElement, BoxElement, ImageElement, warm_up
 from zpl.label import Label
+from zpl.graphics import GraphicStore, decode_graphic_data
+from zpl.serial import SerialNumber, SerialMask
 import os
+import re
 from PIL import Image
 import traceback
 
-print("Script started")
-
-def parse_zpl(zpl_data):
+def parse_zpl(zpl_data, graphic_store=None):
     label = Label(850, 1200)  # Adjust size as needed
+    # Pass the same GraphicStore for every label of a batch so downloaded
+    # graphics (~DG/~DY) and repeated ^GF fields are decoded only once
+    if graphic_store is None:
+        graphic_store = GraphicStore()
     state = {
         'current_x': 0,
         'current_y': 0,
@@ -18,6 +23,7 @@ def parse_zpl(zpl_data):
         'barcode_type': None,
         'barcode_height': None,
         'barcode_width': None,
+        'last_field': None,  # (element, attribute) of the current field, for ^SF
     }
 
     def handle_bc(parts):
@@ -63,6 +69,7 @@ def parse_zpl(zpl_data):
                 label.add_element(barcode_element)
                 print(f"Added barcode element: {barcode_element}")
                 state['expecting_barcode'] = False
+                state['last_field'] = (barcode_element, 'data')
             else:
                 text_element = TextElement(
                     state['current_x'],
@@ -74,9 +81,46 @@ def parse_zpl(zpl_data):
                 )
                 label.add_element(text_element)
                 print(f"Added text element: {text_element}")
+                state['last_field'] = (text_element, 'text')
         else:
             print("No field data provided for FD command")
 
+    def handle_sn(parts):
+        # ^SN replaces ^FD: start value, increment, leading zeros
+        if parts and parts[0]:
+            start = parts[0]
+            increment = int(parts[1]) if len(parts) > 1 and parts[1].strip().lstrip('-').isdigit() else 1
+            leading_zeros = len(parts) > 2 and parts[2].strip().upper() == 'Y'
+            handle_fd([start])
+            if state['last_field']:
+                element, attribute = state['last_field']
+                label.add_serial_field(element, attribute, SerialNumber(start, increment, leading_zeros))
+                print(f"Serialized field: start={start}, increment={increment}, leading_zeros={leading_zeros}")
+        else:
+            print("Insufficient parameters for SN command")
+
+    def handle_sf(parts):
+        # ^SF follows ^FD: mask string, increment string
+        if parts and parts[0] and state['last_field']:
+            element, attribute = state['last_field']
+            increment = parts[1] if len(parts) > 1 and parts[1] else None
+            try:
+                serial = SerialMask(getattr(element, attribute), parts[0], increment)
+            except ValueError as e:
+                print(f"Invalid SF command: {str(e)}")
+                return
+            label.add_serial_field(element, attribute, serial)
+            print(f"Serialized field: mask={parts[0]}, increment={increment}")
+        else:
+            print("SF command needs a mask and a preceding FD")
+
+    def handle_pq(parts):
+        if parts and parts[0].strip().isdigit():
+            label.quantity = max(int(parts[0]), 1)
+            print(f"Print quantity set to {label.quantity}")
+        else:
+            print("Insufficient parameters for PQ command")
+
     def handle_fo(parts):
         if len(parts) == 2:
             state['current_x'], state['current_y'] = map(int, parts)
@@ -163,13 +207,11 @@ def parse_zpl(zpl_data):
 
             print(f"Calculated dimensions: {width}x{height}")
             
-            image_element = ImageElement(
+            graphic = graphic_store.decode_gf(format, total, bytes_per_row, full_data)
+            image_element = ImageElement.from_graphic(
                 state['current_x'],
                 state['current_y'],
-                width,
-                height,
-                full_data,
-                format
+                graphic
             )
             label.add_element(image_element)
             print(f"Adding image at position ({state['current_x']}, {state['current_y']}) with size {width}x{height}")
@@ -177,9 +219,70 @@ def parse_zpl(zpl_data):
             print("Insufficient parameters for GF command")
             print(f"Received parts: {parts}")
 
+    def handle_dg(parts):
+        if len(parts) >= 4:
+            name, total, bytes_per_row, *data_parts = parts
+            graphic = graphic_store.download_graphic(name, total, bytes_per_row, ','.join(data_parts))
+            print(f"Stored graphic {name}: {graphic}")
+        else:
+            print("Insufficient parameters for DG command")
+            print(f"Received parts: {parts}")
+
+    def handle_dy(parts):
+        if len(parts) >= 6:
+            name, format, extension, total, bytes_per_row, *data_parts = parts
+            format = format.upper() or 'A'
+            extension = extension.upper() or 'G'
+            data = ','.join(data_parts)
+            if extension == 'P' or format == 'P':
+                if '.' not in name:
+                    name = f"{name}.PNG"
+                png_data = decode_graphic_data(data, 1, int(total), 'B' if format == 'B' else 'A')
+                graphic = graphic_store.download_image(name, png_data)
+            elif extension == 'G':
+                graphic = graphic_store.download_graphic(name, total, bytes_per_row, data, format)
+            else:
+                print(f"Unsupported DY file extension: {extension}")
+                return
+            print(f"Stored graphic {name}: {graphic}")
+        else:
+            print("Insufficient parameters for DY command")
+            print(f"Received parts: {parts}")
+
+    def recall_graphic(name, mag_x=1, mag_y=1):
+        graphic = graphic_store.get(name)
+        if graphic is None:
+            print(f"Graphic not found: {name}")
+            return
+        image_element = ImageElement.from_graphic(state['current_x'], state['current_y'], graphic, mag_x, mag_y)
+        label.add_element(image_element)
+        print(f"Recalled graphic {name} at ({state['current_x']}, {state['current_y']}) magnified {mag_x}x{mag_y}")
+
+    def handle_xg(parts):
+        if parts and parts[0]:
+            mag_x = int(parts[1]) if len(parts) > 1 and parts[1].strip().isdigit() else 1
+            mag_y = int(parts[2]) if len(parts) > 2 and parts[2].strip().isdigit() else 1
+            recall_graphic(parts[0], max(mag_x, 1), max(mag_y, 1))
+        else:
+            print("Insufficient parameters for XG command")
+
+    def handle_im(parts):
+        if parts and parts[0]:
+            recall_graphic(parts[0])
+        else:
+            print("Insufficient parameters for IM command")
+
+    def handle_id(parts):
+        if parts and parts[0]:
+            if graphic_store.delete(parts[0]):
+                print(f"Deleted graphic {parts[0]}")
+        else:
+            print("Insufficient parameters for ID command")
+
     def handle_fs(parts):
         print("FS command received - Field Separator")
         state['reverse_field'] = False  # Reset reverse field after each field
+        state['last_field'] = None
 
     def handle_fr(parts):
         print("FR command received - Reverse Field mode activated")
@@ -209,11 +312,19 @@ def parse_zpl(zpl_data):
                 width = int(width)
                 print(f"Setting label width to: {width}")
                 state['label_width'] = width
+                label.width = width
             except ValueError:
                 print(f"Invalid width value for PW command: {width}")
         else:
             print("Insufficient parameters for PW command")
 
+    def handle_ll(parts):
+        if parts and parts[0].strip().isdigit():
+            label.height = int(parts[0])
+            print(f"Setting label length to: {label.height}")
+        else:
+            print("Insufficient parameters for LL command")
+
     def handle_ci(parts):
         if parts:
             code_page = parts[0]
@@ -244,11 +355,22 @@ def parse_zpl(zpl_data):
         'FR': handle_fr,
         'A0': handle_a0,
         'PW': handle_pw,
+        'LL': handle_ll,  # Label Length - Sets the label height in dots
         'CI': handle_ci,
-        'BX': handle_bx   # DataMatrix 
+        'BX': handle_bx,  # DataMatrix 
+        'DG': handle_dg,  # Download Graphic - Stores a graphic by name (~DG)
+        'DY': handle_dy,  # Download Objects - Stores a graphic or PNG by name (~DY)
+        'XG': handle_xg,  # Recall Graphic - Draws a stored graphic with magnification
+        'IM': handle_im,  # Image Move - Draws a stored graphic
+        'ID': handle_id,  # Object Delete - Removes a stored graphic
+        'SN': handle_sn,  # Serialization Data - Field data that increments per copy
+        'SF': handle_sf,  # Serialization Field - Increments the preceding ^FD by mask
+        'PQ': handle_pq,  # Print Quantity - Number of copies, see Label.render_copies
     }
 
-    commands = zpl_data.strip().split('^')
+    # ^ starts a format command; ~ only starts the supported control commands,
+    # so a ~ in field data or a 0x7E byte in a ^GFB payload stays put
+    commands = re.split(r'\^|~(?=D[GY])', zpl_data.strip())
     for command in commands:
         if not command:
             continue
@@ -291,8 +413,7 @@ def main():
         output_file = os.path.join(output_directory, 'output.png')
         
         # Assuming 'label' is your Label object
-        image = label.render()
-        image.save(output_file)
+        label.save(output_file, 'png')
         print(f"Label saved successfully as: {output_file}")
     except Exception as e:
         print(f"An error occurred: {str(e)}")
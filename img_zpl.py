@@ -1,5 +1,14 @@
+import os
+import sys
+import glob
 import math
-from PIL import Image
+import zlib
+import base64
+import binascii
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageMath, ImageOps
 
 # Mapping values
 map_code = {
@@ -8,17 +17,38 @@ map_code = {
     220: "q", 240: "r", 260: "s", 280: "t", 300: "u", 320: "v", 340: "w", 360: "x", 380: "y", 400: "z"
 }
 
+# One alternative per hex digit so findall returns whole runs
+_HEX_RUN = re.compile('|'.join(digit + '+' for digit in '0123456789ABCDEF'))
+
 class IMG_ZPL:
     def __init__(self):
         self.black_limit = 380
         self.total = 0
         self.width_bytes = 0
         self.compress_hex = False
+        self.output_format = 'A'  # 'A' (hex), 'B' (binary) or 'Z64'
+        self.dither = False
+        self.dpmm = None
+        self.label_width_mm = None
 
     def convert_from_image(self, image_path):
         # Open the image, ensuring compatibility with PNG, JPG, and BMP formats
-        image = Image.open(image_path).convert("RGB")
-        hex_ascii = self.create_body(image)
+        image = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
+        image = self.scale_image(image).convert("RGB")
+        packed = self.create_packed(image)
+        return self.convert_from_packed(packed, self.width_bytes)
+
+    def convert_from_packed(self, packed, width_bytes):
+        # packed holds rows of width_bytes bytes with 1 = black, e.g. zpl.output.pack_bits(label_image)
+        self.width_bytes = width_bytes
+        self.total = len(packed)
+
+        if self.output_format == 'B':
+            return "^GFB,{},{},{},{}".format(self.total, self.total, self.width_bytes, packed.decode('latin-1'))
+        if self.output_format == 'Z64':
+            return "^GFA,{},{},{},{}".format(self.total, self.total, self.width_bytes, self.encode_z64(packed))
+
+        hex_ascii = self.packed_to_hex(packed)
         if self.compress_hex:
             hex_ascii = self.encode_hex_ascii(hex_ascii)
 
@@ -27,110 +57,251 @@ class IMG_ZPL:
 
         return zpl_code
 
-    def create_body(self, bitmap_image):
-        sb = []
+    def scale_image(self, image):
+        # Scale to the label width (mm) at the target dpmm, or from the image's own dpi to the target dpmm
+        if not self.dpmm:
+            return image
+        if self.label_width_mm:
+            target_width = round(self.label_width_mm * self.dpmm)
+        elif image.info.get('dpi'):
+            target_width = round(image.width * self.dpmm * 25.4 / float(image.info['dpi'][0]))
+        else:
+            return image
+        if target_width <= 0 or target_width == image.width:
+            return image
+        target_height = max(round(image.height * target_width / image.width), 1)
+        return image.resize((target_width, target_height), Image.LANCZOS)
+
+    def create_packed(self, bitmap_image):
+        # Packed rows with 1 = black, padding bits at the end of each row stay white
         width, height = bitmap_image.size
-        index = 0
-        aux_binary_char = ['0', '0', '0', '0', '0', '0', '0', '0']
         self.width_bytes = math.ceil(width / 8)
         self.total = self.width_bytes * height
 
-        for h in range(height):
-            for w in range(width):
-                rgb = bitmap_image.getpixel((w, h))  # Returns a tuple (R, G, B)
-                red, green, blue = rgb  # Unpack the tuple directly
-                
-                aux_char = '1'
-                total_color = red + green + blue
-                if total_color > self.black_limit:
-                    aux_char = '0'
-                
-                aux_binary_char[index] = aux_char
-                index += 1
-                if index == 8 or w == (width - 1):
-                    sb.append(self.four_byte_binary(''.join(aux_binary_char)))
-                    aux_binary_char = ['0', '0', '0', '0', '0', '0', '0', '0']
-                    index = 0
-            sb.append("\n")
-        
-        return ''.join(sb)
-
-    def four_byte_binary(self, binary_str):
-        decimal = int(binary_str, 2)
-        if decimal > 15:
-            return hex(decimal)[2:].upper()
+        if self.dither:
+            # Floyd-Steinberg on the inverted gray image so that set bits are black
+            inverted = ImageOps.invert(bitmap_image.convert("L"))
+            mono = inverted.convert("1", dither=Image.Dither.FLOYDSTEINBERG)
         else:
-            return "0" + hex(decimal)[2:].upper()
+            red, green, blue = bitmap_image.split()
+            limit = self.black_limit
+            if hasattr(ImageMath, 'lambda_eval'):
+                black = ImageMath.lambda_eval(lambda args: (args['r'] + args['g'] + args['b']) <= limit, r=red, g=green, b=blue)
+            else:
+                black = ImageMath.eval("(r + g + b) <= limit", r=red, g=green, b=blue, limit=limit)
+            mono = black.convert("L").point([0] + [255] * 255, "1")
+
+        return mono.tobytes()
+
+    def create_body(self, bitmap_image):
+        return self.packed_to_hex(self.create_packed(bitmap_image))
+
+    def packed_to_hex(self, packed):
+        # One line of hex per row, each terminated by a newline
+        row = self.width_bytes
+        hex_data = packed.hex().upper()
+        return ''.join(hex_data[i:i + row * 2] + "\n" for i in range(0, len(hex_data), row * 2))
+
+    def encode_z64(self, packed):
+        encoded = base64.b64encode(zlib.compress(packed, 9)).decode('ascii')
+        return ":Z64:{}:{:04X}".format(encoded, binascii.crc_hqx(encoded.encode('ascii'), 0))
 
     def encode_hex_ascii(self, code):
-        max_line = self.width_bytes * 2
+        # Run-length encode each row: repeat counts from map_code, ',' / '!' for rows
+        # of all 0 / all F and ':' for a row equal to the previous one
         sb_code = []
-        sb_line = []
         previous_line = None
-        counter = 1
-        first_char = False
-        aux = code[0]
-        
-        for i in range(1, len(code)):
-            if first_char:
-                aux = code[i]
-                first_char = False
+        for row in code.split("\n"):
+            if not row:
                 continue
-            if code[i] == '\n':
-                if counter >= max_line and aux == '0':
-                    sb_line.append(",")
-                elif counter >= max_line and aux == 'F':
-                    sb_line.append("!")
-                elif counter > 20:
-                    multi_20 = (counter // 20) * 20
-                    resto_20 = (counter % 20)
-                    sb_line.append(map_code.get(multi_20))
-                    if resto_20 != 0:
-                        sb_line.append(map_code.get(resto_20) + aux)
-                    else:
-                        sb_line.append(aux)
-                else:
-                    sb_line.append(map_code.get(counter) + aux)
-                counter = 1
-                first_char = True
-                if ''.join(sb_line) == previous_line:
-                    sb_code.append(":")
-                else:
-                    sb_code.append(''.join(sb_line))
-                previous_line = ''.join(sb_line)
-                sb_line.clear()
-                continue
-            if aux == code[i]:
-                counter += 1
-            else:
-                if counter > 20:
-                    multi_20 = (counter // 20) * 20
-                    resto_20 = (counter % 20)
-                    sb_line.append(map_code.get(multi_20))
-                    if resto_20 != 0:
-                        sb_line.append(map_code.get(resto_20) + aux)
-                    else:
-                        sb_line.append(aux)
-                else:
-                    sb_line.append(map_code.get(counter) + aux)
-                counter = 1
-                aux = code[i]
-        
+            line = self.encode_hex_row(row)
+            sb_code.append(":" if line == previous_line else line)
+            previous_line = line
         return ''.join(sb_code)
 
+    def encode_hex_row(self, row):
+        if row.count('0') == len(row):
+            return ","
+        if row.count('F') == len(row):
+            return "!"
+        sb = []
+        for run in _HEX_RUN.findall(row):
+            count = len(run)
+            if count <= 400:
+                sb.append(_COUNT_CODES[count])
+            else:
+                sb.append(self.encode_count(count))
+            sb.append(run[0])
+        return ''.join(sb)
+
+    @staticmethod
+    def encode_count(count):
+        # Counts above 400 are written as several 'z' (400) codes
+        sb = []
+        while count > 400:
+            sb.append(map_code[400])
+            count -= 400
+        if count >= 20:
+            sb.append(map_code[(count // 20) * 20])
+            count %= 20
+        if count:
+            sb.append(map_code[count])
+        return ''.join(sb)
+
     def set_compress_hex(self, compress_hex):
         self.compress_hex = compress_hex
 
     def set_blackness_limit_percentage(self, percentage):
         self.black_limit = (percentage * 768 // 100)
 
+    def set_output_format(self, output_format):
+        output_format = output_format.upper()
+        if output_format in ('GFA', 'GFB'):
+            output_format = output_format[2]
+        if output_format not in ('A', 'B', 'Z64'):
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
 
+    def set_dither(self, dither):
+        self.dither = dither
+
+    def set_scale(self, dpmm, label_width_mm=None):
+        self.dpmm = dpmm
+        self.label_width_mm = label_width_mm
+
+
+_COUNT_CODES = [IMG_ZPL.encode_count(count) for count in range(401)]
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff')
+
+
+def find_images(sources):
+    # Expand directories and glob patterns into a sorted list of image files, each listed once
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(source, name))
+        else:
+            paths.extend(sorted(glob.glob(source)) or [source])
+    return list(dict.fromkeys(os.path.normpath(path) for path in paths))
+
+
+def output_names(paths):
+    """Map each image path to a unique .zpl file name.
+
+    Images are named after their stem; when stems collide (a/x.png and b/x.png,
+    or x.png and x.jpg) the relative path and extension are folded into the name.
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    counts = {}
+    for stem in stems:
+        counts[stem] = counts.get(stem, 0) + 1
+
+    common = os.path.commonpath([os.path.abspath(path) for path in paths]) if len(paths) > 1 else ''
+    names = {}
+    for path, stem in zip(paths, stems):
+        if counts[stem] > 1:
+            relative = os.path.relpath(os.path.abspath(path), common)
+            stem = relative.replace(os.sep, '__').replace('.', '_')
+            print(f"Warning: several images are named like {path}, writing it as {stem}.zpl", file=sys.stderr)
+        names[path] = stem + '.zpl'
+    return names
 
-if __name__=="__main__":
-    zpl_converter = IMG_ZPL()
-    zpl_converter.set_compress_hex(True)  # Set compress hex if needed
-    zpl_converter.set_blackness_limit_percentage(99)  # Set blackness limit (percentage)
 
-    image_path = 'logo.png'  # Update with your image path
-    zpl_code = zpl_converter.convert_from_image(image_path)
-    print(zpl_code)
\ No newline at end of file
+def _convert_one(job):
+    # Errors are returned per file so one bad image does not stop the batch
+    image_path, output_path, options = job
+    try:
+        zpl_converter = IMG_ZPL()
+        zpl_converter.set_compress_hex(options.get('compress_hex', False))
+        zpl_converter.set_blackness_limit_percentage(options.get('black_limit', 50))
+        zpl_converter.set_output_format(options.get('output_format', 'A'))
+        zpl_converter.set_dither(options.get('dither', False))
+        zpl_converter.set_scale(options.get('dpmm'), options.get('label_width_mm'))
+
+        zpl_code = zpl_converter.convert_from_image(image_path)
+        if options.get('wrap_label'):
+            zpl_code = "^XA^FO0,0{}^FS^XZ".format(zpl_code)
+        if output_path is None:
+            return image_path, zpl_code, None
+        with open(output_path, 'w', encoding='latin-1', newline='') as file:
+            file.write(zpl_code)
+        return image_path, output_path, None
+    except Exception as e:
+        return image_path, None, f"{type(e).__name__}: {str(e)}"
+
+
+def convert_images(sources, output_dir=None, workers=None, **options):
+    """Convert many images to ZPL ^GF fields in a process pool.
+
+    sources is a list of files, directories or glob patterns. Returns
+    (image, result, error) tuples: with output_dir each image is written to a
+    unique <output_dir>/<name>.zpl and result is that path, otherwise result is
+    the ZPL text. For images that failed, result is None and error says why.
+    Options: output_format ('A', 'B' or 'Z64'), compress_hex, black_limit
+    (percentage), dither, dpmm, label_width_mm and wrap_label.
+    """
+    paths = find_images(sources)
+    names = output_names(paths) if output_dir is not None else {}
+    jobs = []
+    for image_path in paths:
+        output_path = os.path.join(output_dir, names[image_path]) if output_dir is not None else None
+        jobs.append((image_path, output_path, options))
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if workers == 1 or len(jobs) <= 1:
+        return [_convert_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_convert_one, jobs, chunksize=max(len(jobs) // ((workers or os.cpu_count() or 1) * 4), 1)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert images to ZPL ^GF graphic fields")
+    parser.add_argument('sources', nargs='*', default=['logo.png'], help="Image files, directories or glob patterns")
+    parser.add_argument('-o', '--output-dir', help="Write one .zpl file per image here instead of printing")
+    parser.add_argument('-f', '--format', default='GFA', choices=['GFA', 'GFB', 'Z64'], help="Graphic field encoding")
+    parser.add_argument('-c', '--compress', action='store_true', help="Use ZPL compressed hex (GFA only)")
+    parser.add_argument('-b', '--black-limit', type=int, default=50, help="Blackness limit percentage")
+    parser.add_argument('-d', '--dither', action='store_true', help="Floyd-Steinberg dithering instead of the fixed threshold")
+    parser.add_argument('--dpmm', type=int, help="Target printer resolution in dots per mm (6, 8, 12, 24)")
+    parser.add_argument('--label-width', type=float, help="Scale images to this label width in mm (needs --dpmm)")
+    parser.add_argument('--wrap', action='store_true', help="Wrap each graphic in ^XA^FO0,0 ... ^FS^XZ")
+    parser.add_argument('-j', '--workers', type=int, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if args.label_width is not None and args.dpmm is None:
+        parser.error("--label-width needs --dpmm")
+
+    results = convert_images(
+        args.sources,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        output_format=args.format,
+        compress_hex=args.compress,
+        black_limit=args.black_limit,
+        dither=args.dither,
+        dpmm=args.dpmm,
+        label_width_mm=args.label_width,
+        wrap_label=args.wrap,
+    )
+    failed = 0
+    for image_path, result, error in results:
+        if error is not None:
+            failed += 1
+            print(f"{image_path}: {error}", file=sys.stderr)
+        elif args.output_dir is None:
+            # ^GFB payloads are binary, so write the latin-1 bytes as they are
+            sys.stdout.buffer.write(result.encode('latin-1') + b'\n')
+        else:
+            print(f"{image_path} -> {result}", file=sys.stderr)
+    sys.stdout.flush()
+    if failed:
+        print(f"{failed} of {len(results)} images failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -1,2 +1,2 @@
 from .label import Label
-from .elements import Text, Barcode
\ No newline at end of file
+from .elements import Text, Barcode, warm_up
\ No newline at end of file
@@ -1,12 +1,38 @@
 import os
 import math
 from io import BytesIO
-from PIL import Image, ImageFont, ImageDraw, ImageOps, ImageColor, ImageFilter
-from barcode import Code128
-from barcode.writer import ImageWriter
-from barcode.charsets import code128
-from pystrich.code128 import Code128Encoder
-from pystrich.datamatrix import DataMatrixEncoder
+from functools import lru_cache
+from PIL import Image, ImageFont, ImageDraw
+from zpl import gs1
+from zpl.graphics import StoredGraphic, decode_graphic_data
+
+# Barcode encoders are imported on first use of each symbology (see warm_up)
+SYMBOLOGIES = ('code128', 'gs1-128', 'datamatrix')
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts")
+FONT_FILES = ("RobotoCondensed-Regular.ttf", "RobotoCondensed-Bold.ttf")
+
+
+@lru_cache(maxsize=None)
+def load_font(font_path, font_size):
+    return ImageFont.truetype(font_path, font_size)
+
+
+def warm_up(symbologies=SYMBOLOGIES, font_sizes=()):
+    """Import barcode encoders and load fonts ahead of the first label.
+
+    Call this once at process start (e.g. outside a serverless handler) to
+    move the one-off costs out of the first render.
+    """
+    for symbology in symbologies:
+        if symbology == 'datamatrix':
+            from pystrich.datamatrix import DataMatrixEncoder
+        elif symbology in ('code128', 'gs1-128'):
+            from pystrich.code128 import Code128Encoder
+        else:
+            raise ValueError(f"Unknown symbology: {symbology}")
+    for font_name in FONT_FILES:
+        for font_size in font_sizes:
+            load_font(os.path.join(FONT_DIR, font_name), font_size)
 
 class Text:
     def __init__(self, x, y, text, font_size=12, font=None):
@@ -39,6 +65,14 @@ class BaseElement:
     def draw(self, draw):
         pass
 
+    def vertical_extent(self):
+        # (top, bottom) in dots, used by Label.render_bands; None means anywhere on the label
+        return None
+
+    def bounding_box(self):
+        # (left, top, right, bottom) in dots, used by Label.render_copies; None means anywhere
+        return None
+
 class TextElement(BaseElement):
     def __init__(self, x, y, text, font_size=12, bold=False, reverse=False):
         super().__init__(x, y)
@@ -49,15 +83,14 @@ class TextElement(BaseElement):
         self.font_path = self._get_font_path()
 
     def _get_font_path(self):
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         font_name = "RobotoCondensed-Bold.ttf" if self.bold else "RobotoCondensed-Regular.ttf"
-        font_path = os.path.join(base_dir, "fonts", font_name)
+        font_path = os.path.join(FONT_DIR, font_name)
         print(f"Font path: {font_path}")
         return font_path
 
     def draw(self, draw):
         try:
-            font = ImageFont.truetype(self.font_path, self.font_size)
+            font = load_font(self.font_path, self.font_size)
             
             # Debug print
             print(f"Drawing text: '{self.text}', reverse={self.reverse}, font_size={self.font_size}")
@@ -78,6 +111,14 @@ class TextElement(BaseElement):
             import traceback
             traceback.print_exc()
 
+    def vertical_extent(self):
+        left, top, right, bottom = load_font(self.font_path, self.font_size).getbbox(self.text, anchor="lt")
+        return self.y + top, self.y + bottom
+
+    def bounding_box(self):
+        left, top, right, bottom = load_font(self.font_path, self.font_size).getbbox(self.text, anchor="lt")
+        return self.x + left, self.y + top, self.x + right, self.y + bottom
+
 class LineElement(BaseElement):
     def __init__(self, x, y, width, height, thickness, line_color, reverse=False):
         super().__init__(x, y)
@@ -102,6 +143,12 @@ class LineElement(BaseElement):
             for i in range(self.thickness):
                 draw.line([(self.x + i, self.y), (self.x + i, self.y + self.height - 1)], fill=line_color)
 
+    def vertical_extent(self):
+        return self.y, self.y + max(self.height, self.thickness) + 1
+
+    def bounding_box(self):
+        return self.x, self.y, self.x + max(self.width, self.thickness) + 1, self.y + max(self.height, self.thickness) + 1
+
     def __str__(self):
         return f"LineElement(x={self.x}, y={self.y}, width={self.width}, height={self.height}, thickness={self.thickness}, line_color={self.line_color}, reverse={self.reverse})"
 
@@ -117,21 +164,29 @@ class BoxElement(BaseElement):
 
     def draw(self, draw):
         try:
+            # Swap colors locally so the element can be drawn more than once
+            line_color = self.line_color
+            fill_color = self.fill_color
             if self.reverse:
-                temp = self.line_color
-                self.line_color = self.fill_color or (255, 255, 255)
-                self.fill_color = temp
+                line_color = self.fill_color or (255, 255, 255)
+                fill_color = self.line_color
 
-            if self.fill_color:
-                draw.rectangle([self.x, self.y, self.x + self.width, self.y + self.height], fill=self.fill_color)
+            if fill_color:
+                draw.rectangle([self.x, self.y, self.x + self.width, self.y + self.height], fill=fill_color)
 
             for i in range(self.thickness):
-                draw.rectangle([self.x + i, self.y + i, self.x + self.width - i, self.y + self.height - i], outline=self.line_color)
+                draw.rectangle([self.x + i, self.y + i, self.x + self.width - i, self.y + self.height - i], outline=line_color)
 
             print(f"Drew BoxElement: {self}")
         except Exception as e:
             print(f"Error drawing BoxElement: {str(e)}")
 
+    def vertical_extent(self):
+        return self.y, self.y + self.height + 1
+
+    def bounding_box(self):
+        return self.x, self.y, self.x + self.width + 1, self.y + self.height + 1
+
     def __str__(self):
         return f"BoxElement(x={self.x}, y={self.y}, width={self.width}, height={self.height}, thickness={self.thickness}, line_color={self.line_color}, fill_color={self.fill_color}, reverse={self.reverse})"
 
@@ -146,74 +201,74 @@ class BarcodeElement(BaseElement):
         self.height = height
         self.barcode_type = barcode_type
         self.quality = quality
+        self._cached_image = None  # (data, image, y offset)
 
-    # Define a set of known GS1 Application Identifiers
-    GS1_AIS = {
-        '00', '01', '02', '10', '11', '12', '13', '15', '17', '20', 
-        '21', '22', '240', '241', '242', '250', '251', '253', '254', '255',
-        '30', '310', '311', '312', '313', '314', '315', '316', '320', '321', '322', '323', '324', '325', '326', '327', '328', '329',
-        '330', '331', '332', '333', '334', '335', '336', '337', '340', '341', '342', '343', '344', '345', '346', '347', '348', '349',
-        '350', '351', '352', '353', '354', '355', '356', '357', '360', '361', '362', '363', '364', '365', '366', '367', '368', '369',
-        '37', '390', '391', '392', '393', '394', '395', '400', '401', '402', '403',
-        '410', '411', '412', '413', '414', '415', '416', '417', '420', '421', '422', '423', '424', '425', '426', '427',
-        '7001', '7002', '7003', '7004', '7005', '7006', '7007', '7008', '7009', '7010',
-        '7020', '7021', '7022', '7023', '7030', '7031', '7032', '7033', '7034', '7035', '7036', '7037', '7038', '7039',
-        '710', '711', '712', '713', '714', '715', '723',
-        '8001', '8002', '8003', '8004', '8005', '8006', '8007', '8008', '8009', '8010', '8011', '8012', '8013', '8017', '8018', '8019',
-        '8020', '8026', '8110', '8111', '8112', '8200',
-        '90', '91', '92', '93', '94', '95', '96', '97', '98', '99'
-    }
-
-    def _format_gs1_128_data(self, data):
+    def _parse_gs1_data(self, data):
         # Remove start and stop characters if present
         if data.startswith('>;') and data.endswith('>;'):
             data = data[2:-2]
-        
-        parts = data.split('>8')  # Split by the GS character
-        formatted_parts = []
-        for part in parts:
-            # Split each part by '>; ' in case there are multiple AIs within a GS section
-            subparts = part.split('>;')
-            for subpart in subparts:
-                if subpart.startswith(';'):
-                    # Remove the leading semicolon
-                    subpart = subpart[1:]
-                    # Find the longest matching AI
-                    ai = next((ai for ai in sorted(self.GS1_AIS, key=len, reverse=True) if subpart.startswith(ai)), None)
-                    if ai:
-                        value = subpart[len(ai):]
-                        formatted_parts.append(f'({ai}){value}')
-                    else:
-                        print(f"Warning: Unknown AI in part: {subpart}")
-                        formatted_parts.append(subpart)
-                elif subpart:  # Only add non-empty subparts
-                    formatted_parts.append(subpart)
-        
-        # Join all parts with the FNC1 character (ASCII 29) between them
-        return '\xf1' + '\xf1'.join(formatted_parts)
+
+        # >8 (Zebra FNC1), FNC1 itself and >; followed by ; separate fields;
+        # any other >; only switches to subset C
+        data = data.replace('>;;', gs1.GS).replace('>8', gs1.GS).replace('\xf1', gs1.GS).replace('>;', '')
+        if ';' in data:
+            # Drop the leading semicolon of each section
+            data = gs1.GS.join(section.lstrip(';') for section in data.split(gs1.GS))
+        return data
+
+    def _format_gs1_128_data(self, data, separator='\xf1'):
+        data = self._parse_gs1_data(data)
+        try:
+            elements = gs1.parse_element_string(data)
+        except ValueError as e:
+            print(f"Warning: Invalid GS1 data ({str(e)}), encoding sections as given")
+            return separator + separator.join(section for section in data.split(gs1.GS) if section)
+        # FNC1 first, then only after variable-length fields
+        return separator + gs1.encode_element_string(elements, separator)
+
+    def _barcode_image(self):
+        # Generated once per data value, so bands and repeated renders reuse it
+        if self._cached_image is not None and self._cached_image[0] == self.data:
+            return self._cached_image[1], self._cached_image[2]
+
+        if self.barcode_type == 'datamatrix':
+            barcode_image = self._generate_datamatrix()
+            y_offset = self.height - barcode_image.height
+        else:
+            # Existing logic for other barcode types
+            actual_type = 'gs1-128' if self.data.startswith('>;') and self.data.endswith('>;') else self.barcode_type
+            
+            if actual_type == 'gs1-128':
+                barcode_image = self._generate_gs1_128()
+            elif actual_type == 'datamatrix':
+                barcode_image = self._generate_datamatrix()
+            else:  # Default to Code 128
+                barcode_image = self._generate_code_128()
+
+            # Resize the barcode image
+            barcode_image = barcode_image.resize((self.width, self.height), Image.NEAREST)
+            y_offset = 0
+
+        self._cached_image = (self.data, barcode_image, y_offset)
+        return barcode_image, y_offset
+
+    def vertical_extent(self):
+        # Measured without building the barcode except for DataMatrix, whose size depends on the data
+        left, top, right, bottom = self.bounding_box()
+        return top, bottom
+
+    def bounding_box(self):
+        if self.barcode_type != 'datamatrix':
+            # Linear barcodes are resized to width x height
+            return self.x, self.y, self.x + self.width, self.y + self.height
+        barcode_image, y_offset = self._barcode_image()
+        return self.x, self.y + y_offset, self.x + barcode_image.width, self.y + y_offset + barcode_image.height
 
     def draw(self, draw):
         try:
-            if self.barcode_type == 'datamatrix':
-                img = self._generate_datamatrix()
-                adjusted_y = self.y + self.height - img.height
-                draw._image.paste(img, (self.x, adjusted_y))
-            else:
-                # Existing logic for other barcode types
-                actual_type = 'gs1-128' if self.data.startswith('>;') and self.data.endswith('>;') else self.barcode_type
-                
-                if actual_type == 'gs1-128':
-                    barcode_image = self._generate_gs1_128()
-                elif actual_type == 'datamatrix':
-                    barcode_image = self._generate_datamatrix()
-                else:  # Default to Code 128
-                    barcode_image = self._generate_code_128()
-
-                # Resize the barcode image
-                barcode_image = barcode_image.resize((self.width, self.height), Image.NEAREST)
-
-                # Paste the barcode onto the label
-                draw._image.paste(barcode_image, (self.x, self.y))
+            barcode_image, y_offset = self._barcode_image()
+            # Paste the barcode onto the label
+            draw._image.paste(barcode_image, (self.x, self.y + y_offset))
 
             print(f"Drew barcode: {self.data} at ({self.x}, {self.y}) with size {self.width}x{self.height}")
         except Exception as e:
@@ -222,10 +277,12 @@ class BarcodeElement(BaseElement):
             traceback.print_exc()
 
     def _generate_code_128(self):
+        from pystrich.code128 import Code128Encoder
         encoder = Code128Encoder(self.data, options={'show_label': False})
         return self._encoder_to_image(encoder)
 
     def _generate_gs1_128(self):
+        from pystrich.code128 import Code128Encoder
         formatted_data = self._format_gs1_128_data(self.data)
         print("Raw data sent to encoder:")
         print(' '.join(f'{ord(c):02X}' for c in formatted_data))  # Print hex values
@@ -234,17 +291,14 @@ class BarcodeElement(BaseElement):
         return self._encoder_to_image(encoder)
 
     def _generate_datamatrix(self):
+        from pystrich.datamatrix import DataMatrixEncoder
         try:
             if self.data.startswith('_1'):
-                # Remove the '_1' prefix before formatting
-                data_without_prefix = self.data[2:]
-                # Replace internal '_1' with FNC1 character (ASCII 29)
-                data_without_prefix = data_without_prefix.replace('_1', chr(29))
-                formatted_data = self._format_gs1_128_data(data_without_prefix)
-                # Remove the FNC1 character that _format_gs1_128_data adds at the start
-                formatted_data = formatted_data[1:]
-                # Add the GS1 FNC1 character (ASCII 232) at the start
-                gs1_data = chr(231) + formatted_data
+                # Internal '_1' marks a field separator (ASCII 29)
+                data_without_prefix = self.data[2:].replace('_1', gs1.GS)
+                formatted_data = self._format_gs1_128_data(data_without_prefix, separator=gs1.GS)
+                # Swap the leading separator for FNC1 (codeword 232, encoded as ASCII 231 + 1)
+                gs1_data = chr(231) + formatted_data[1:]
             else:
                 gs1_data = self.data
             print(f"GS1 Data: {gs1_data}")
@@ -287,8 +341,14 @@ class LogoElement(BaseElement):
             draw.rectangle([self.x, self.y, self.x + self.width, self.y + self.height], outline="red")
             draw.text((self.x + 5, self.y + self.height // 2), "Error", fill="red")
 
+    def vertical_extent(self):
+        return self.y, self.y + self.height + 1
+
+    def bounding_box(self):
+        return self.x, self.y, self.x + self.width + 1, self.y + self.height + 1
+
 class ImageElement:
-    def __init__(self, x, y, width, height, image_data, format):
+    def __init__(self, x, y, width, height, image_data, format, graphic=None, mag_x=1, mag_y=1):
         self.x = x
         self.y = y
         self.width = width
@@ -297,100 +357,35 @@ class ImageElement:
         self.format = format
         self.widthBytes = (width + 7) // 8
         self.total = self.widthBytes * height
-        self.mapCode = self.initialize_map_code()
+        self.graphic = graphic  # Already decoded StoredGraphic, e.g. from a GraphicStore
+        self.mag_x = mag_x
+        self.mag_y = mag_y
 
-    @staticmethod
-    def initialize_map_code():
-        mapCode = {}
-        for i in range(1, 20):
-            mapCode[i] = chr(ord('G') + i - 1)
-        for i in range(20, 401, 20):
-            mapCode[i] = chr(ord('g') + (i // 20) - 1)
-        return mapCode
+    @classmethod
+    def from_graphic(cls, x, y, graphic, mag_x=1, mag_y=1):
+        return cls(x, y, graphic.width, graphic.height, None, 'A', graphic=graphic, mag_x=mag_x, mag_y=mag_y)
 
     def gfa_to_image(self):
-        hex_data = self.ascii_to_hex(self.image_data)
-        binary_data = self.hex_to_binary(hex_data)
-        image = Image.new('1', (self.width, self.height))
-        pixels = image.load()
-
-        for y in range(self.height):
-            for x in range(self.width):
-                byte_index = (y * self.widthBytes) + (x // 8)
-                bit_index = 7 - (x % 8)
-                if byte_index < len(binary_data):
-                    pixel = (binary_data[byte_index] >> bit_index) & 1
-                    pixels[x, y] = 255 if pixel == 0 else 0  # 0 for black, 255 for white
-
-        return image
-
-    def ascii_to_hex(self, ascii_data):
-        hex_lines = []
-        current_line = ""
-        previous_line = ""
-        
-        for char in ascii_data:
-            if char in '0123456789ABCDEF':
-                current_line += char
-            elif char in self.mapCode.values():
-                count = next(key for key, value in self.mapCode.items() if value == char)
-                current_line += '0' * count
-            elif char == ',':
-                # Pad the current line to the full width before adding it
-                padded_line = self.pad_line(current_line)
-                if padded_line:
-                    hex_lines.append(padded_line)
-                    previous_line = padded_line
-                current_line = ""
-            elif char == ':':
-                if previous_line:
-                    hex_lines.append(previous_line)
-            # Ignore other characters
-
-        # Don't forget to add the last line if there's no trailing comma
-        if current_line:
-            padded_line = self.pad_line(current_line)
-            if padded_line:
-                hex_lines.append(padded_line)
-
-        return '\n'.join(hex_lines)
-
-    def pad_line(self, line):
-        # Calculate how many hex characters we need for a full line
-        full_line_length = self.widthBytes * 2
-        if len(line) > full_line_length:
-            # If the line is too long, truncate it
-            return line[:full_line_length]
-        elif len(line) < full_line_length:
-            # If the line is too short, pad it with '0's
-            return line.ljust(full_line_length, '0')
-        else:
-            # If the line is exactly the right length, return it as is
-            return line
-
-    def hex_to_binary(self, hex_data):
-        binary_data = bytearray()
-        for line in hex_data.split('\n'):
-            for i in range(0, len(line), 2):
-                if i + 1 < len(line):
-                    binary_data.append(int(line[i:i+2], 16))
-                else:
-                    binary_data.append(int(line[i] + '0', 16))
-        return binary_data
+        if self.graphic is None:
+            packed = decode_graphic_data(self.image_data, self.widthBytes, self.total, self.format)
+            self.graphic = StoredGraphic(self.width, self.height, self.widthBytes, packed)
+        return self.graphic.to_image(self.mag_x, self.mag_y)
+
+    def vertical_extent(self):
+        # From the ^GF / ^XG parameters, so the graphic is only decoded when its band is drawn
+        return self.y, self.y + self.height * self.mag_y
+
+    def bounding_box(self):
+        return self.x, self.y, self.x + self.width * self.mag_x, self.y + self.height * self.mag_y
 
     def draw(self, draw):
         print(f"Attempting to draw image: format={self.format}, width={self.width}, height={self.height}")
-        print(f"Image data length: {len(self.image_data)}")
-        
-        if self.format == 'A':  # ASCII format
+
+        if self.graphic is not None or self.format in ('A', 'B'):
             try:
                 image = self.gfa_to_image()
                 draw._image.paste(image, (self.x, self.y))
-                print(f"Successfully drew image at ({self.x}, {self.y}), size {self.width}x{self.height}")
-                
-                # Save the image for debugging
-                image.save("debug_image.png")
-                print("Saved debug image as 'debug_image.png'")
+                print(f"Successfully drew image at ({self.x}, {self.y}), size {image.width}x{image.height}")
             except Exception as e:
                 print(f"Error drawing ImageElement: {str(e)}")
                 import traceback
@@ -0,0 +1,166 @@
+"""Golden-image regression check for rendered labels.
+
+Every <name>.zpl in the fixtures directory is rendered with parse_zpl and
+Label.render and compared with golden/<name>.png. Bitmaps are compared as
+packed 1-bit rows (XOR + popcount), so a run over the whole corpus takes
+seconds. Diff images are only written for fixtures that fail.
+
+    python -m zpl.golden                 # check all fixtures
+    python -m zpl.golden --update        # re-render the golden images
+    python -m zpl.golden shipping -j 4   # only fixtures whose name contains 'shipping'
+"""
+import io
+import os
+import sys
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageChops
+
+from zpl.output import pack_bits, to_monochrome, write_png
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(BASE_DIR, 'golden', 'fixtures')
+GOLDEN_DIR = os.path.join(BASE_DIR, 'golden', 'expected')
+
+
+def render_fixture(path):
+    # Import here so worker processes only pay for it when they render
+    from ZPLConvert import parse_zpl, read_zpl_data
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return to_monochrome(parse_zpl(read_zpl_data(path)).render())
+
+
+def _popcount(data):
+    number = int.from_bytes(data, 'big')
+    return number.bit_count() if hasattr(number, 'bit_count') else bin(number).count('1')
+
+
+def compare_bitmaps(actual, expected):
+    """Compare two mode '1' images.
+
+    Returns (mismatched pixels, total pixels, bounding boxes); each box covers
+    a run of consecutive differing rows.
+    """
+    if actual.size != expected.size:
+        return actual.width * actual.height, actual.width * actual.height, [(0, 0, actual.width, actual.height)]
+
+    actual_bits = pack_bits(actual)
+    expected_bits = pack_bits(expected)
+    total = actual.width * actual.height
+    if actual_bits == expected_bits:
+        return 0, total, []
+
+    diff = (int.from_bytes(actual_bits, 'big') ^ int.from_bytes(expected_bits, 'big')).to_bytes(len(actual_bits), 'big')
+    mismatched = _popcount(diff)
+
+    # Group differing rows into runs, then let PIL find the horizontal extent of each run
+    stride = (actual.width + 7) // 8
+    empty_row = bytes(stride)
+    xor_image = ImageChops.logical_xor(actual, expected)
+    boxes = []
+    run_start = None
+    for row in range(actual.height + 1):
+        differs = row < actual.height and diff[row * stride:(row + 1) * stride] != empty_row
+        if differs and run_start is None:
+            run_start = row
+        elif not differs and run_start is not None:
+            box = xor_image.crop((0, run_start, actual.width, row)).getbbox()
+            if box:
+                boxes.append((box[0], run_start + box[1], box[2], run_start + box[3]))
+            run_start = None
+
+    return mismatched, total, boxes
+
+
+def diff_image(actual, expected):
+    # Expected in light gray, mismatched pixels in red
+    base = expected.convert('L').point(lambda v: 255 if v else 200).convert('RGB')
+    if actual.size != expected.size:
+        return base
+    mask = ImageChops.logical_xor(actual, expected)
+    base.paste((255, 0, 0), mask=mask)
+    return base
+
+
+def check_fixture(name, fixture_dir=FIXTURE_DIR, golden_dir=GOLDEN_DIR, diff_dir=None, update=False, tolerance=0.0):
+    """Render one fixture and compare it; returns a result dict."""
+    actual = render_fixture(os.path.join(fixture_dir, name + '.zpl'))
+    golden_path = os.path.join(golden_dir, name + '.png')
+
+    if update:
+        os.makedirs(golden_dir, exist_ok=True)
+        write_png(actual, golden_path, compress_level=9)
+        return {'name': name, 'status': 'updated'}
+    if not os.path.exists(golden_path):
+        return {'name': name, 'status': 'missing', 'golden': golden_path}
+
+    with Image.open(golden_path) as golden:
+        golden.load()
+        expected = to_monochrome(golden)
+    mismatched, total, boxes = compare_bitmaps(actual, expected)
+    percentage = 100.0 * mismatched / total if total else 0.0
+    result = {'name': name, 'status': 'ok', 'mismatched': mismatched, 'percentage': percentage, 'boxes': boxes}
+
+    if mismatched and percentage > tolerance:
+        result['status'] = 'failed'
+        if diff_dir:
+            os.makedirs(diff_dir, exist_ok=True)
+            result['diff'] = os.path.join(diff_dir, name + '.diff.png')
+            diff_image(actual, expected).save(result['diff'])
+            actual.save(os.path.join(diff_dir, name + '.actual.png'))
+    return result
+
+
+def find_fixtures(fixture_dir=FIXTURE_DIR, patterns=()):
+    names = sorted(os.path.splitext(f)[0] for f in os.listdir(fixture_dir) if f.endswith('.zpl'))
+    if patterns:
+        names = [name for name in names if any(pattern in name for pattern in patterns)]
+    return names
+
+
+def run(patterns=(), fixture_dir=FIXTURE_DIR, golden_dir=GOLDEN_DIR, diff_dir=None, update=False, tolerance=0.0, workers=None):
+    names = find_fixtures(fixture_dir, patterns)
+    kwargs = dict(fixture_dir=fixture_dir, golden_dir=golden_dir, diff_dir=diff_dir, update=update, tolerance=tolerance)
+    if workers == 1 or len(names) <= 1:
+        return [check_fixture(name, **kwargs) for name in names]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(check_fixture, name, **kwargs) for name in names]
+        return [future.result() for future in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare rendered ZPL fixtures with golden images")
+    parser.add_argument('patterns', nargs='*', help="Only run fixtures whose name contains one of these")
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help="Directory of .zpl fixtures")
+    parser.add_argument('--golden', default=GOLDEN_DIR, help="Directory of golden .png images")
+    parser.add_argument('--diff-dir', default=os.path.join(BASE_DIR, 'golden', 'diff'), help="Where to write diffs of failed fixtures")
+    parser.add_argument('--update', action='store_true', help="Re-render the golden images instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=0.0, help="Allowed mismatch in percent")
+    parser.add_argument('-j', '--workers', type=int, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    results = run(args.patterns, args.fixtures, args.golden, args.diff_dir, args.update, args.tolerance, args.workers)
+    failed = 0
+    for result in results:
+        status = result['status']
+        if status == 'updated':
+            print(f"UPDATED  {result['name']}")
+        elif status == 'missing':
+            failed += 1
+            print(f"MISSING  {result['name']}: no golden image at {result['golden']}")
+        else:
+            line = f"{status.upper():8} {result['name']}: {result['mismatched']} pixels ({result['percentage']:.4f}%)"
+            if result['boxes']:
+                line += f" in {result['boxes']}"
+            if 'diff' in result:
+                line += f" -> {result['diff']}"
+            failed += status == 'failed'
+            print(line)
+    print(f"{len(results) - failed} passed, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
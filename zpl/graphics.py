@@ -0,0 +1,255 @@
+import re
+import zlib
+import base64
+import hashlib
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+
+from zpl.output import INVERT_BITS, pack_bits
+
+# Repeat counts used by ZPL compressed ASCII hex: G..Y = 1..19, g..z = 20..400
+REPEAT_CODES = {chr(ord('G') + i): i + 1 for i in range(19)}
+REPEAT_CODES.update({chr(ord('g') + i): (i + 1) * 20 for i in range(20)})
+
+HEX_CHARS = set('0123456789ABCDEFabcdef')
+DRIVES = ('R', 'E', 'B', 'A')
+
+_PLAIN_HEX = re.compile(r'[0-9A-Fa-f\s]*')
+
+
+def decode_graphic_data(data, bytes_per_row, total_bytes, format='A'):
+    """Decode ^GF / ~DG field data into packed rows (1 = black)."""
+    encoded = data.strip()
+    if encoded.startswith(':Z64:') or encoded.startswith(':B64:'):
+        payload = encoded[5:].split(':', 1)[0]
+        packed = base64.b64decode(payload)
+        if encoded.startswith(':Z64:'):
+            packed = zlib.decompress(packed)
+    elif format == 'B':
+        # Binary payload: whitespace bytes are pixel data, so nothing is stripped
+        packed = data.encode('latin-1')
+    elif _PLAIN_HEX.fullmatch(encoded):
+        hex_data = ''.join(encoded.split())
+        if len(hex_data) % 2:
+            hex_data += '0'
+        packed = bytes.fromhex(hex_data)
+    else:
+        packed = _decode_compressed_hex(data, bytes_per_row)
+
+    if len(packed) < total_bytes:
+        packed += bytes(total_bytes - len(packed))
+    return bytes(packed[:total_bytes])
+
+
+def _decode_compressed_hex(data, bytes_per_row):
+    row_chars = bytes_per_row * 2
+    rows = []
+    line = ''
+    previous = '0' * row_chars
+    count = 0
+
+    for char in data:
+        if char in HEX_CHARS:
+            line += char * (count or 1)
+            count = 0
+            while len(line) >= row_chars:
+                previous = line[:row_chars]
+                rows.append(previous)
+                line = line[row_chars:]
+        elif char in REPEAT_CODES:
+            count += REPEAT_CODES[char]
+        elif char == ',':
+            # Fill the rest of the row with zeros
+            previous = line.ljust(row_chars, '0')
+            rows.append(previous)
+            line = ''
+        elif char == '!':
+            # Fill the rest of the row with ones
+            previous = line.ljust(row_chars, 'F')
+            rows.append(previous)
+            line = ''
+        elif char == ':':
+            # Repeat the previous row
+            rows.append(previous)
+            line = ''
+        # Ignore other characters (line breaks etc.)
+
+    if line:
+        rows.append(line.ljust(row_chars, '0'))
+
+    return bytes.fromhex(''.join(rows))
+
+
+def image_to_packed(image, threshold=128):
+    """Threshold a PIL image into packed rows (1 = black)."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        background.alpha_composite(image.convert('RGBA'))
+        image = background
+    bytes_per_row = (image.width + 7) // 8
+    return image.width, image.height, bytes_per_row, pack_bits(image, threshold)
+
+
+def packed_to_image(packed, width, height, bytes_per_row):
+    """Build a mode '1' PIL image from packed rows (1 = black)."""
+    raw = bytes(packed).translate(INVERT_BITS)
+    image = Image.frombytes('1', (bytes_per_row * 8, height), raw)
+    if width < bytes_per_row * 8:
+        image = image.crop((0, 0, width, height))
+    return image
+
+
+def normalize_graphic_name(name, default_extension='GRF'):
+    name = name.strip().upper()
+    if len(name) > 1 and name[1] == ':':
+        drive, name = name[0], name[2:]
+    else:
+        drive = 'R'
+    if drive not in DRIVES:
+        print(f"Unknown drive '{drive}:', using R:")
+        drive = 'R'
+    if '.' not in name:
+        name = f"{name}.{default_extension}"
+    return f"{drive}:{name}"
+
+
+class StoredGraphic:
+    __slots__ = ('width', 'height', 'bytes_per_row', 'data', '_images')
+
+    def __init__(self, width, height, bytes_per_row, data):
+        self.width = width
+        self.height = height
+        self.bytes_per_row = bytes_per_row
+        self.data = data
+        self._images = {}
+
+    def to_image(self, mag_x=1, mag_y=1):
+        key = (mag_x, mag_y)
+        image = self._images.get(key)
+        if image is None:
+            if key == (1, 1):
+                image = packed_to_image(self.data, self.width, self.height, self.bytes_per_row)
+            else:
+                image = self.to_image().resize((self.width * mag_x, self.height * mag_y), Image.NEAREST)
+            self._images[key] = image
+        return image
+
+    def __repr__(self):
+        return f"StoredGraphic(width={self.width}, height={self.height}, bytes_per_row={self.bytes_per_row})"
+
+
+class GraphicStore:
+    """Decoded graphics keyed by 'drive:NAME.EXT', shared across labels in a batch.
+
+    ~DG / ~DY put graphics in the store once, ^XG / ^IM recall them, and
+    identical ^GF fields are decoded once while they stay among the
+    gf_cache_size most recently used ones (0 turns the cache off).
+    A store can be exported to shared memory and attached from worker processes.
+    """
+
+    def __init__(self, gf_cache_size=32):
+        self.graphics = {}
+        self.gf_cache_size = gf_cache_size
+        self._gf_cache = OrderedDict()
+        self._shm = None
+        self._owns_shm = False
+
+    def __contains__(self, name):
+        return normalize_graphic_name(name) in self.graphics
+
+    def __len__(self):
+        return len(self.graphics)
+
+    def get(self, name):
+        return self.graphics.get(normalize_graphic_name(name))
+
+    def delete(self, name):
+        return self.graphics.pop(normalize_graphic_name(name), None) is not None
+
+    def store(self, name, bytes_per_row, data, width=None):
+        bytes_per_row = max(int(bytes_per_row), 1)
+        height = len(data) // bytes_per_row
+        graphic = StoredGraphic(width or bytes_per_row * 8, height, bytes_per_row, data)
+        self.graphics[normalize_graphic_name(name)] = graphic
+        return graphic
+
+    def download_graphic(self, name, total_bytes, bytes_per_row, data, format='A'):
+        """~DG: store hex (optionally compressed) graphic data under name."""
+        total_bytes = int(total_bytes)
+        bytes_per_row = max(int(bytes_per_row), 1)
+        packed = decode_graphic_data(data, bytes_per_row, total_bytes, format)
+        return self.store(name, bytes_per_row, packed)
+
+    def download_image(self, name, data):
+        """~DY with PNG content: decode and threshold the image once."""
+        image = Image.open(BytesIO(data))
+        width, height, bytes_per_row, packed = image_to_packed(image)
+        return self.store(name, bytes_per_row, packed, width=width)
+
+    def decode_gf(self, format, total_bytes, bytes_per_row, data):
+        """^GF: decode field data, reusing the result for identical fields."""
+        # Keyed on a digest so the cache does not keep the raw field text alive
+        digest = hashlib.blake2b(data.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        key = (format, int(total_bytes), int(bytes_per_row), digest)
+        graphic = self._gf_cache.get(key)
+        if graphic is not None:
+            self._gf_cache.move_to_end(key)
+            return graphic
+
+        bytes_per_row = max(int(bytes_per_row), 1)
+        packed = decode_graphic_data(data, bytes_per_row, int(total_bytes), format)
+        graphic = StoredGraphic(bytes_per_row * 8, len(packed) // bytes_per_row, bytes_per_row, packed)
+        if self.gf_cache_size > 0:
+            self._gf_cache[key] = graphic
+            while len(self._gf_cache) > self.gf_cache_size:
+                self._gf_cache.popitem(last=False)
+        return graphic
+
+    def export_shared(self):
+        """Copy all named graphics into one shared memory block.
+
+        Returns a picklable manifest for GraphicStore.attach_shared().
+        The exporting store owns the block and unlinks it on close().
+        """
+        from multiprocessing import shared_memory
+
+        self.close()
+        index = {}
+        offset = 0
+        for name, graphic in self.graphics.items():
+            size = len(graphic.data)
+            index[name] = (offset, size, graphic.width, graphic.bytes_per_row)
+            offset += size
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self._owns_shm = True
+        for name, (start, size, _, _) in index.items():
+            self._shm.buf[start:start + size] = self.graphics[name].data
+        return {'shm_name': self._shm.name, 'graphics': index}
+
+    @classmethod
+    def attach_shared(cls, manifest):
+        """Create a store whose graphics are views on an exported shared memory block."""
+        from multiprocessing import shared_memory
+
+        store = cls()
+        store._shm = shared_memory.SharedMemory(name=manifest['shm_name'])
+        for name, (start, size, width, bytes_per_row) in manifest['graphics'].items():
+            store.store(name, bytes_per_row, store._shm.buf[start:start + size], width=width)
+        return store
+
+    def close(self):
+        if self._shm is None:
+            return
+        if not self._owns_shm:
+            # Views on the block must be released before it can be closed
+            for graphic in self.graphics.values():
+                if isinstance(graphic.data, memoryview):
+                    graphic.data.release()
+            self.graphics.clear()
+        self._shm.close()
+        if self._owns_shm:
+            self._shm.unlink()
+        self._shm = None
+        self._owns_shm = False
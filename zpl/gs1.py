@@ -0,0 +1,135 @@
+GS = chr(29)  # Separator after variable-length fields (FNC1 in GS1-128)
+
+# AI: (fixed data length or None, maximum data length)
+# Entries ending in 'n' stand for the ten AIs with a decimal-point digit (e.g. 3100-3109)
+_AI_TABLE = {
+    '00': (18, 18), '01': (14, 14), '02': (14, 14), '10': (None, 20),
+    '11': (6, 6), '12': (6, 6), '13': (6, 6), '15': (6, 6), '16': (6, 6), '17': (6, 6),
+    '20': (2, 2), '21': (None, 20), '22': (None, 20),
+    '240': (None, 30), '241': (None, 30), '242': (None, 6),
+    '250': (None, 30), '251': (None, 30), '253': (None, 30), '254': (None, 20), '255': (None, 25),
+    '30': (None, 8), '37': (None, 8),
+    '310n': (6, 6), '311n': (6, 6), '312n': (6, 6), '313n': (6, 6), '314n': (6, 6), '315n': (6, 6), '316n': (6, 6),
+    '320n': (6, 6), '321n': (6, 6), '322n': (6, 6), '323n': (6, 6), '324n': (6, 6), '325n': (6, 6), '326n': (6, 6),
+    '327n': (6, 6), '328n': (6, 6), '329n': (6, 6),
+    '330n': (6, 6), '331n': (6, 6), '332n': (6, 6), '333n': (6, 6), '334n': (6, 6), '335n': (6, 6), '336n': (6, 6),
+    '337n': (6, 6),
+    '340n': (6, 6), '341n': (6, 6), '342n': (6, 6), '343n': (6, 6), '344n': (6, 6), '345n': (6, 6), '346n': (6, 6),
+    '347n': (6, 6), '348n': (6, 6), '349n': (6, 6),
+    '350n': (6, 6), '351n': (6, 6), '352n': (6, 6), '353n': (6, 6), '354n': (6, 6), '355n': (6, 6), '356n': (6, 6),
+    '357n': (6, 6),
+    '360n': (6, 6), '361n': (6, 6), '362n': (6, 6), '363n': (6, 6), '364n': (6, 6), '365n': (6, 6), '366n': (6, 6),
+    '367n': (6, 6), '368n': (6, 6), '369n': (6, 6),
+    '390n': (None, 15), '391n': (None, 18), '392n': (None, 15), '393n': (None, 18), '394n': (4, 4), '395n': (6, 6),
+    '400': (None, 30), '401': (None, 30), '402': (17, 17), '403': (None, 30),
+    '410': (13, 13), '411': (13, 13), '412': (13, 13), '413': (13, 13), '414': (13, 13), '415': (13, 13),
+    '416': (13, 13), '417': (13, 13),
+    '420': (None, 20), '421': (None, 12), '422': (3, 3), '423': (None, 15), '424': (3, 3), '425': (None, 15),
+    '426': (3, 3), '427': (None, 3),
+    '7001': (13, 13), '7002': (None, 30), '7003': (10, 10), '7004': (None, 4), '7005': (None, 12),
+    '7006': (6, 6), '7007': (None, 12), '7008': (None, 3), '7009': (None, 10), '7010': (None, 2),
+    '7020': (None, 20), '7021': (None, 20), '7022': (None, 20), '7023': (None, 30), '703n': (None, 30),
+    '710': (None, 20), '711': (None, 20), '712': (None, 20), '713': (None, 20), '714': (None, 20), '715': (None, 20),
+    '723n': (None, 30),
+    '8001': (14, 14), '8002': (None, 20), '8003': (None, 30), '8004': (None, 30), '8005': (6, 6), '8006': (18, 18),
+    '8007': (None, 34), '8008': (None, 12), '8009': (None, 50), '8010': (None, 30), '8011': (None, 12),
+    '8012': (None, 20), '8013': (None, 25), '8017': (18, 18), '8018': (18, 18), '8019': (None, 10),
+    '8020': (None, 25), '8026': (18, 18), '8110': (None, 70), '8111': (4, 4), '8112': (None, 70), '8200': (None, 70),
+    '90': (None, 30), '91': (None, 90), '92': (None, 90), '93': (None, 90), '94': (None, 90), '95': (None, 90),
+    '96': (None, 90), '97': (None, 90), '98': (None, 90), '99': (None, 90),
+}
+
+# AIs whose first two digits are in this table never need a separator, even as the last field
+PREDEFINED_LENGTH_PREFIXES = {
+    '00', '01', '02', '03', '04', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
+    '31', '32', '33', '34', '35', '36', '41',
+}
+
+
+def _expand(table):
+    rules = {}
+    for ai, rule in table.items():
+        if ai.endswith('n'):
+            for digit in '0123456789':
+                rules[ai[:-1] + digit] = rule
+        else:
+            rules[ai] = rule
+    return rules
+
+
+def _build_trie(ais):
+    root = {}
+    for ai in ais:
+        node = root
+        for digit in ai:
+            node = node.setdefault(digit, {})
+        node[''] = ai
+    return root
+
+
+AI_RULES = _expand(_AI_TABLE)
+AI_TRIE = _build_trie(AI_RULES)
+
+
+def match_ai(data, start=0):
+    """Longest known AI at data[start:], or None."""
+    node = AI_TRIE
+    ai = None
+    for char in data[start:start + 4]:
+        node = node.get(char)
+        if node is None:
+            break
+        ai = node.get('', ai)
+    return ai
+
+
+def parse_element_string(data):
+    """Split GS1 data into (ai, value) pairs in one pass.
+
+    Fields are separated by GS (chr 29) where needed; fixed-length fields may
+    be followed directly by the next AI. Raises ValueError on unknown AIs or
+    values that break the length rules.
+    """
+    elements = []
+    position = 0
+    length = len(data)
+
+    while position < length:
+        if data[position] == GS:
+            position += 1
+            continue
+
+        ai = match_ai(data, position)
+        if ai is None:
+            raise ValueError(f"Unknown AI at position {position}: {data[position:position + 4]}")
+        position += len(ai)
+        fixed_length, max_length = AI_RULES[ai]
+
+        if fixed_length:
+            end = position + fixed_length
+            value = data[position:end]
+            if len(value) < fixed_length or GS in value:
+                raise ValueError(f"AI ({ai}) needs {fixed_length} characters, got '{value}'")
+        else:
+            end = data.find(GS, position)
+            if end < 0:
+                end = length
+            value = data[position:end]
+            if not value or len(value) > max_length:
+                raise ValueError(f"AI ({ai}) takes 1 to {max_length} characters, got {len(value)}")
+
+        elements.append((ai, value))
+        position = end
+
+    return elements
+
+
+def encode_element_string(elements, separator=GS):
+    """Join (ai, value) pairs, placing separators only after variable-length fields."""
+    parts = []
+    last = len(elements) - 1
+    for index, (ai, value) in enumerate(elements):
+        parts.append(ai + value)
+        if index < last and ai[:2] not in PREDEFINED_LENGTH_PREFIXES:
+            parts.append(separator)
+    return ''.join(parts)
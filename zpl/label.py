@@ -1,5 +1,6 @@
 from PIL import Image, ImageDraw
 from zpl.elements import LineElement, BoxElement  # Add this import at the top of the file
+from zpl.output import write_image, write_bands, pack_into
   # Add this import at the top of the file
 
 class Label:
@@ -7,16 +8,153 @@ class Label:
         self.width = width
         self.height = height
         self.elements = []
+        self.quantity = 1  # ^PQ
+        self.serial_fields = []  # (element, attribute, SerialNumber/SerialMask) from ^SN/^SF
 
     def add_element(self, element):
         self.elements.append(element)
 
-    def render(self):
-        image = Image.new('RGB', (self.width, self.height), color='white')
-        draw = ImageDraw.Draw(image)
-        for element in self.elements:
+    def add_serial_field(self, element, attribute, serial):
+        # attribute is the element field that changes per copy ('text' or 'data')
+        self.serial_fields.append((element, attribute, serial))
+
+    def _draw_elements(self, draw, elements):
+        for element in elements:
             try:
                 element.draw(draw)
             except Exception as e:
                 print(f"Error drawing element {type(element).__name__}: {str(e)}")
+
+    def render(self):
+        image = Image.new('RGB', (self.width, self.height), color='white')
+        draw = ImageDraw.Draw(image)
+        self._draw_elements(draw, self.elements)
         return image
+
+    def render_copies(self, quantity=None):
+        """Lazily render every copy of the label (^PQ), applying ^SN/^SF serialization.
+
+        The fixed part of the label is rendered once. Each copy starts from it
+        and redraws only the serialized fields plus the later elements that
+        overlap them, in their original order, so the result matches render().
+        """
+        quantity = self.quantity if quantity is None else quantity
+        originals = [(element, attribute, getattr(element, attribute)) for element, attribute, _ in self.serial_fields]
+
+        try:
+            # Union of each serialized field's box over all copies
+            serial_boxes = {}
+            for copy_index in range(quantity):
+                for element, attribute, serial in self.serial_fields:
+                    setattr(element, attribute, serial.value(copy_index))
+                    serial_boxes[id(element)] = _union_box(serial_boxes.get(id(element), ()), self._bounding_box(element))
+
+            # An element is redrawn per copy if it is serialized or drawn over one that is
+            dynamic_boxes = []
+            dynamic = []
+            fixed_elements = []
+            for element in self.elements:
+                box = serial_boxes.get(id(element))
+                if box is None:
+                    box = self._bounding_box(element)
+                    if not any(_boxes_overlap(box, other) for other in dynamic_boxes):
+                        fixed_elements.append(element)
+                        continue
+                dynamic_boxes.append(box)
+                dynamic.append(element)
+
+            fixed = Image.new('RGB', (self.width, self.height), color='white')
+            self._draw_elements(ImageDraw.Draw(fixed), fixed_elements)
+
+            for copy_index in range(quantity):
+                for element, attribute, serial in self.serial_fields:
+                    setattr(element, attribute, serial.value(copy_index))
+                image = fixed.copy()
+                self._draw_elements(ImageDraw.Draw(image), dynamic)
+                yield image
+        finally:
+            # Put the field data back so render() shows the label as parsed
+            for element, attribute, value in originals:
+                setattr(element, attribute, value)
+
+    def _bounding_box(self, element):
+        # Elements without a known box cover the whole label
+        box = None
+        if hasattr(element, 'bounding_box'):
+            try:
+                box = element.bounding_box()
+            except Exception as e:
+                print(f"Error measuring element {type(element).__name__}: {str(e)}")
+        return box if box else (0, 0, self.width, self.height)
+
+    def _element_extents(self):
+        # (top, bottom, index, element); elements without a known extent cover the whole label
+        extents = []
+        for index, element in enumerate(self.elements):
+            extent = None
+            if hasattr(element, 'vertical_extent'):
+                try:
+                    extent = element.vertical_extent()
+                except Exception as e:
+                    print(f"Error measuring element {type(element).__name__}: {str(e)}")
+            top, bottom = extent if extent else (0, self.height)
+            extents.append((top, bottom, index, element))
+        extents.sort(key=lambda extent: extent[0])
+        return extents
+
+    def render_bands(self, band_height=256):
+        """Lazily render the label as horizontal strips of band_height rows.
+
+        Yields (top, image) pairs. Only elements that overlap a band are drawn
+        into it, in their original order, so peak memory depends on the band
+        height rather than the label length.
+        """
+        band_height = max(int(band_height), 1)
+        extents = self._element_extents()
+        next_extent = 0
+        active = []
+
+        for top in range(0, self.height, band_height):
+            bottom = min(top + band_height, self.height)
+            while next_extent < len(extents) and extents[next_extent][0] < bottom:
+                active.append(extents[next_extent])
+                next_extent += 1
+            active = [extent for extent in active if extent[1] > top]
+
+            band = Image.new('RGB', (self.width, bottom - top), color='white')
+            draw = ImageDraw.Draw(band)
+            for _, _, _, element in sorted(active, key=lambda extent: extent[2]):
+                # Elements draw at absolute positions, so shift them into the band
+                element.y -= top
+                try:
+                    self._draw_elements(draw, [element])
+                finally:
+                    element.y += top
+            yield top, band
+
+    def save_banded(self, fp, format='png', band_height=256, **options):
+        # Like save(), but encodes band by band without a full-size canvas
+        write_bands(self.render_bands(band_height), fp, self.width, self.height, format, **options)
+
+    def save(self, fp, format='png', **options):
+        # Render and encode straight to a path or stream, see zpl.output for formats
+        write_image(self.render(), fp, format, **options)
+
+    def packed_size(self):
+        return (self.width + 7) // 8 * self.height
+
+    def render_into(self, buffer, offset=0):
+        # Render as packed 1-bit rows (1 = black) into a caller-supplied buffer
+        return pack_into(self.render(), buffer, offset)
+
+
+def _union_box(box, other):
+    if not box:
+        return other
+    return min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])
+
+
+def _boxes_overlap(box, other, margin=1):
+    # The margin covers anti-aliased text edges just outside the measured box
+    return (box[0] - margin < other[2] and other[0] - margin < box[2]
+            and box[1] - margin < other[3] and other[1] - margin < box[3])
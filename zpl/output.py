@@ -0,0 +1,129 @@
+import os
+import zlib
+import struct
+from PIL import Image
+
+# Packed output uses the printer convention: 1 = black, rows padded to whole bytes
+OUTPUT_FORMATS = ('png', 'png-rgb', 'raw', 'pbm', 'tiff')
+BAND_FORMATS = ('png', 'raw', 'pbm')
+
+# PIL mode '1' uses the opposite convention (1 = white); translate() with this flips every bit
+INVERT_BITS = bytes(255 - i for i in range(256))
+
+
+def to_monochrome(image, threshold=128):
+    """Threshold a rendered label to mode '1' without dithering."""
+    if image.mode == '1':
+        return image
+    return image.convert('L').point([0] * threshold + [255] * (256 - threshold), '1')
+
+
+def pack_bits(image, threshold=128):
+    """Packed rows of the label, 1 = black."""
+    return to_monochrome(image, threshold).tobytes().translate(INVERT_BITS)
+
+
+def pack_into(image, buffer, offset=0):
+    """Write packed rows into a caller-supplied bytearray or memoryview."""
+    packed = pack_bits(image)
+    view = memoryview(buffer)
+    if offset + len(packed) > len(view):
+        raise ValueError(f"Buffer too small: need {offset + len(packed)} bytes, got {len(view)}")
+    view[offset:offset + len(packed)] = packed
+    return len(packed)
+
+
+def write_png(image, fp, compress_level=6, bilevel=True):
+    # Bilevel PNGs are 1 bit per pixel, so there is much less for zlib to do
+    if bilevel:
+        image = to_monochrome(image)
+    image.save(fp, 'PNG', compress_level=compress_level)
+
+
+def write_raw(image, fp):
+    fp.write(pack_bits(image))
+
+
+def write_pbm(image, fp):
+    # Binary PBM (P4) uses the same bit order as the packed rows
+    fp.write(b'P4\n%d %d\n' % (image.width, image.height))
+    fp.write(pack_bits(image))
+
+
+def write_tiff(images, fp, compression='group4'):
+    """Write an iterable of labels as a multi-page CCITT G4 TIFF.
+
+    Pages are encoded one at a time, so a batch never has to be held in memory.
+    fp must be seekable.
+    """
+    from PIL import TiffImagePlugin
+
+    with TiffImagePlugin.AppendingTiffWriter(fp, new=True) as tiff:
+        for image in images:
+            to_monochrome(image).save(tiff, 'TIFF', compression=compression)
+            tiff.newFrame()
+
+
+def write_image(image, fp, format='png', **options):
+    """Encode a rendered label (or an iterable of labels for 'tiff') to fp.
+
+    fp may be a path or a binary stream such as a BytesIO or socket file; nothing
+    is written to a temporary file.
+    """
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {format}")
+
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, 'w+b' if format == 'tiff' else 'wb') as file:
+            return write_image(image, file, format, **options)
+
+    if format == 'png':
+        write_png(image, fp, **options)
+    elif format == 'png-rgb':
+        write_png(image, fp, bilevel=False, **options)
+    elif format == 'raw':
+        write_raw(image, fp)
+    elif format == 'pbm':
+        write_pbm(image, fp)
+    elif format == 'tiff':
+        images = [image] if isinstance(image, Image.Image) else image
+        write_tiff(images, fp, **options)
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+def write_png_bands(bands, fp, width, height, compress_level=6):
+    """Stream a 1-bit PNG, compressing each band's rows as it arrives."""
+    fp.write(b'\x89PNG\r\n\x1a\n')
+    fp.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)))
+    stride = (width + 7) // 8
+    compressor = zlib.compressobj(compress_level)
+    for _, band in bands:
+        # PNG grayscale 1-bit matches PIL mode '1' (1 = white); each row gets filter type 0
+        raw = to_monochrome(band).tobytes()
+        rows = b''.join(b'\x00' + raw[i:i + stride] for i in range(0, len(raw), stride))
+        data = compressor.compress(rows)
+        if data:
+            fp.write(_png_chunk(b'IDAT', data))
+    fp.write(_png_chunk(b'IDAT', compressor.flush()))
+    fp.write(_png_chunk(b'IEND', b''))
+
+
+def write_bands(bands, fp, width, height, format='png', **options):
+    """Encode (top, image) bands from Label.render_bands() to a path or stream."""
+    if format not in BAND_FORMATS:
+        raise ValueError(f"Format {format} cannot be written band by band")
+
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, 'wb') as file:
+            return write_bands(bands, file, width, height, format, **options)
+
+    if format == 'png':
+        write_png_bands(bands, fp, width, height, **options)
+        return
+    if format == 'pbm':
+        fp.write(b'P4\n%d %d\n' % (width, height))
+    for _, band in bands:
+        fp.write(pack_bits(band))
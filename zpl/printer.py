@@ -0,0 +1,236 @@
+import os
+import re
+import socket
+import struct
+import contextlib
+from PIL import Image
+
+from zpl.output import pack_bits
+
+# Rendered labels straight to printer languages, without an intermediate PNG.
+# Everything works on packed rows (1 = black), a band at a time for Labels.
+RASTER_FORMATS = ('pwg', 'pcl', 'zpl')
+
+PWG_HEADER_SIZE = 1796
+# ESC*t#R only accepts these; label printer resolutions (203, 300, 600 dpi) map to the nearest
+PCL_RESOLUTIONS = (75, 100, 150, 200, 300, 600)
+_BYTE_RUN = re.compile(rb'(.)\1*', re.S)
+
+
+def page_rows(page, band_height=256):
+    """(width, height, iterator of packed rows) for a Label or a PIL image.
+
+    Labels are rendered band by band, so only one band is in memory at a time.
+    """
+    if isinstance(page, Image.Image):
+        bands = [(0, page)]
+    else:
+        bands = page.render_bands(band_height)
+    width, height = page.width, page.height
+    stride = (width + 7) // 8
+
+    def rows():
+        for _, band in bands:
+            packed = pack_bits(band)
+            for start in range(0, len(packed), stride):
+                yield packed[start:start + stride]
+
+    return width, height, rows()
+
+
+def _byte_runs(row):
+    # (byte, count) for each run of equal bytes in the row
+    return [(match.group(1), match.end() - match.start()) for match in _BYTE_RUN.finditer(row)]
+
+
+def packbits(row):
+    """TIFF PackBits (PCL compression mode 2): n < 128 copies n + 1 literal bytes, 257 - n repeats."""
+    out = []
+    literal = []
+    for value, count in _byte_runs(row):
+        if count < 3:
+            literal.append(value * count)
+            continue
+        _flush_literal(out, literal)
+        while count > 0:
+            chunk = min(count, 128)
+            if chunk < 2:
+                out.append(b'\x00' + value)
+            else:
+                out.append(bytes([257 - chunk]) + value)
+            count -= chunk
+    _flush_literal(out, literal)
+    return b''.join(out)
+
+
+def _flush_literal(out, literal):
+    data = b''.join(literal)
+    literal.clear()
+    for start in range(0, len(data), 128):
+        chunk = data[start:start + 128]
+        out.append(bytes([len(chunk) - 1]) + chunk)
+
+
+def pwg_compress_row(row):
+    """PWG/CUPS raster row encoding: n < 128 repeats the next byte n + 1 times, 257 - n literal bytes follow.
+
+    For 1-bit pages one "pixel" of the encoding is one byte (eight dots).
+    """
+    out = []
+    literal = []
+    for value, count in _byte_runs(row):
+        if count == 1:
+            literal.append(value)
+            continue
+        _flush_pwg_literal(out, literal)
+        while count > 0:
+            chunk = min(count, 128)
+            out.append(bytes([chunk - 1]) + value)
+            count -= chunk
+    _flush_pwg_literal(out, literal)
+    return b''.join(out)
+
+
+def _flush_pwg_literal(out, literal):
+    data = b''.join(literal)
+    literal.clear()
+    for start in range(0, len(data), 128):
+        chunk = data[start:start + 128]
+        if len(chunk) == 1:
+            out.append(b'\x00' + chunk)
+        else:
+            out.append(bytes([257 - len(chunk)]) + chunk)
+
+
+def pwg_page_header(width, height, dpi):
+    header = bytearray(PWG_HEADER_SIZE)
+    header[0:9] = b'PwgRaster'
+    bytes_per_line = (width + 7) // 8
+    struct.pack_into('>II', header, 276, dpi, dpi)  # HWResolution
+    struct.pack_into('>I', header, 340, 1)  # NumCopies
+    struct.pack_into('>II', header, 352, round(width * 72 / dpi), round(height * 72 / dpi))  # PageSize in points
+    struct.pack_into('>IIIIIIIII', header, 372,
+                     width, height,  # cupsWidth, cupsHeight
+                     0,  # cupsMediaType
+                     1, 1,  # cupsBitsPerColor, cupsBitsPerPixel
+                     bytes_per_line,
+                     0,  # cupsColorOrder: chunky
+                     3,  # cupsColorSpace: Black, 1 = black like the packed rows
+                     0)  # cupsCompression
+    struct.pack_into('>I', header, 420, 1)  # cupsNumColors
+    return bytes(header)
+
+
+def encode_pwg(pages, dpi=203, band_height=256):
+    """Yield a PWG raster stream (RaS2) chunk by chunk."""
+    yield b'RaS2'
+    for page in pages:
+        width, height, rows = page_rows(page, band_height)
+        yield pwg_page_header(width, height, dpi)
+        previous = None
+        repeat = 0
+        for row in rows:
+            # Each line starts with a repeat count for identical following lines
+            if row == previous and repeat < 255:
+                repeat += 1
+                continue
+            if previous is not None:
+                yield bytes([repeat]) + pwg_compress_row(previous)
+            previous = row
+            repeat = 0
+        if previous is not None:
+            yield bytes([repeat]) + pwg_compress_row(previous)
+
+
+def pcl_resolution(dpi):
+    """Nearest PCL raster resolution to dpi, within 5%; ValueError otherwise."""
+    resolution = min(PCL_RESOLUTIONS, key=lambda r: abs(r - dpi))
+    if abs(resolution - dpi) > dpi * 0.05:
+        raise ValueError(f"No PCL raster resolution close to {dpi} dpi, expected one of {PCL_RESOLUTIONS}")
+    return resolution
+
+
+def encode_pcl(pages, dpi=203, band_height=256):
+    """Yield PCL 5 raster graphics (compression mode 2) chunk by chunk.
+
+    dpi is mapped to a PCL resolution with pcl_resolution(), so 203 dpi labels are sent as 200.
+    An unsupported dpi raises here, before anything is opened or written.
+    """
+    return _pcl_chunks(pages, pcl_resolution(dpi), band_height)
+
+
+def _pcl_chunks(pages, dpi, band_height):
+    yield b'\x1bE'
+    for page in pages:
+        width, height, rows = page_rows(page, band_height)
+        yield b'\x1b*t%dR\x1b*r%dS\x1b*r%dT\x1b*p0x0Y\x1b*r1A\x1b*b2M' % (dpi, width, height)
+        blank = 0
+        for row in rows:
+            if not row.strip(b'\x00'):
+                blank += 1
+                continue
+            if blank:
+                # Skip runs of white rows with a Y offset instead of sending them
+                yield b'\x1b*b%dY' % blank
+                blank = 0
+            data = packbits(row.rstrip(b'\x00'))
+            yield b'\x1b*b%dW' % len(data) + data
+        yield b'\x1b*rC\x0c'
+    yield b'\x1bE'
+
+
+def encode_zpl(pages, encoding='Z64', band_height=256):
+    """Yield one ^XA ^GF ^XZ label per page, using the IMG_ZPL encoders.
+
+    encoding is 'Z64', 'A' (ASCII hex) or 'compressed' (ZPL compressed hex).
+    """
+    from img_zpl import IMG_ZPL
+
+    zpl_converter = IMG_ZPL()
+    zpl_converter.set_output_format('A' if encoding == 'compressed' else encoding)
+    zpl_converter.set_compress_hex(encoding == 'compressed')
+    for page in pages:
+        width, height, rows = page_rows(page, band_height)
+        graphic = zpl_converter.convert_from_packed(b''.join(rows), (width + 7) // 8)
+        yield ("^XA^PW%d^LL%d^FO0,0%s^FS^XZ\n" % (width, height, graphic)).encode('latin-1')
+
+
+@contextlib.contextmanager
+def open_destination(destination):
+    """Binary stream for a path, an open stream, or a 'host:port' / 'tcp://host:port' raw printer socket."""
+    if hasattr(destination, 'write'):
+        yield destination
+        return
+
+    destination = os.fspath(destination)
+    match = re.fullmatch(r'(?:tcp://)?([\w.\-]+|\[[0-9a-fA-F:]+\]):(\d+)', destination)
+    if match and not os.path.exists(destination):
+        host = match.group(1).strip('[]')
+        with socket.create_connection((host, int(match.group(2)))) as connection:
+            with connection.makefile('wb') as stream:
+                yield stream
+    else:
+        with open(destination, 'wb') as stream:
+            yield stream
+
+
+def write_raster(pages, destination, format='pwg', **options):
+    """Encode Labels or images as PWG raster, PCL raster or single-graphic ZPL and stream them out.
+
+    pages may be a single Label/image or an iterable (e.g. Label.render_copies()).
+    Returns the number of bytes written.
+    """
+    if format not in RASTER_FORMATS:
+        raise ValueError(f"Unknown raster format: {format}")
+    if isinstance(pages, Image.Image) or hasattr(pages, 'render_bands'):
+        pages = [pages]
+
+    encoder = {'pwg': encode_pwg, 'pcl': encode_pcl, 'zpl': encode_zpl}[format]
+    chunks = encoder(pages, **options)
+    written = 0
+    with open_destination(destination) as stream:
+        for chunk in chunks:
+            stream.write(chunk)
+            written += len(chunk)
+        stream.flush()
+    return written
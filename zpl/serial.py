@@ -0,0 +1,73 @@
+import re
+
+# ^SF mask characters and the digits each position counts through
+MASK_DIGITS = {
+    'D': '0123456789',
+    'H': '0123456789ABCDEF',
+    'O': '01234567',
+    'A': 'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    'N': '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+}
+
+_LAST_NUMBER = re.compile(r'(\d+)(?!.*\d)')
+
+
+class SerialNumber:
+    """^SN: the last number in the field counts up by increment on every copy."""
+
+    def __init__(self, start, increment=1, leading_zeros=False):
+        self.start = start
+        self.increment = increment
+        self.leading_zeros = leading_zeros
+        self._match = _LAST_NUMBER.search(start)
+
+    def value(self, copy_index):
+        if self._match is None or copy_index == 0:
+            return self.start
+        digits = self._match.group(1)
+        number = max(int(digits) + copy_index * self.increment, 0)
+        text = str(number).zfill(len(digits)) if self.leading_zeros else str(number)
+        return self.start[:self._match.start(1)] + text + self.start[self._match.end(1):]
+
+
+class SerialMask:
+    """^SF: positions selected by the mask count in their own radix, carrying to the left."""
+
+    def __init__(self, data, mask, increment=None):
+        self.data = data
+        # Mask and increment are right-aligned with the field data
+        mask = mask[-len(data):] if mask else ''
+        offset = len(data) - len(mask)
+        self.positions = []
+        for index, mask_char in enumerate(mask.upper()):
+            digits = MASK_DIGITS.get(mask_char)
+            if digits is not None:
+                self.positions.append((offset + index, digits))
+
+        self.modulus = 1
+        self.start = 0
+        self.increment = 0
+        # Data and increment characters are both looked up in the position's digits,
+        # so for an 'A' position the increment 'F' steps by 5 (A, F, K, ...)
+        # Without one, the rightmost position steps by one in its own digits
+        increment = increment.upper()[-len(self.positions):] if increment and self.positions else ''
+        steps = [None] * (len(self.positions) - len(increment)) + list(increment)
+        if not increment and self.positions:
+            steps[-1] = self.positions[-1][1][1]
+        for (position, digits), step in zip(self.positions, steps):
+            step_value = 0 if step is None else digits.find(step)
+            if step_value < 0:
+                raise ValueError(f"Increment character '{step}' is not one of {digits}")
+            self.modulus *= len(digits)
+            self.start = self.start * len(digits) + max(digits.find(data[position].upper()), 0)
+            self.increment = self.increment * len(digits) + step_value
+
+    def value(self, copy_index):
+        if not self.positions or copy_index == 0:
+            return self.data
+        number = (self.start + copy_index * self.increment) % self.modulus
+        chars = list(self.data)
+        for position, digits in reversed(self.positions):
+            number, index = divmod(number, len(digits))
+            chars[position] = digits[index]
+        return ''.join(chars)